@@ -11,56 +11,178 @@ import json
 import os
 import time
 import random
+import signal
+import sys
 import hashlib
-import urllib.request
+import math
+import hmac
+import gzip
+import bisect
+import heapq
+import itertools
+import queue
+import operator
+import http.client
 import urllib.parse
-import html
 import threading
+import traceback
 import uuid
-from http.server import HTTPServer, SimpleHTTPRequestHandler
-from urllib.error import URLError, HTTPError
+import email.utils
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 
+try:
+    import orjson  # optional C-accelerated JSON, falls back to stdlib json
+except ImportError:
+    orjson = None
+
+
+def _json_default(obj):
+    """Encode in-memory containers that JSON doesn't know about"""
+    if isinstance(obj, deque):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# Built once and reused; compact separators, UTF-8 output instead of \u escapes
+_json_encode = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False,
+                                default=_json_default).encode
+_json_encode_ascii = json.JSONEncoder(separators=(",", ":"), default=_json_default).encode
+
+def _stdlib_json_dumps(obj):
+    """Serialize obj to UTF-8 JSON bytes with the stdlib encoder"""
+    try:
+        return _json_encode(obj).encode()
+    except UnicodeEncodeError:  # lone surrogates, which only \u escapes can carry
+        return _json_encode_ascii(obj).encode()
+
+if orjson is not None:
+    def json_dumps(obj):
+        """Serialize obj to UTF-8 JSON bytes"""
+        try:
+            return orjson.dumps(obj, default=_json_default)
+        except TypeError:
+            # orjson is stricter than stdlib json (ints past 64 bits, lone
+            # surrogates); fall back instead of failing the whole document
+            return _stdlib_json_dumps(obj)
+
+    json_loads = orjson.loads
+else:
+    json_dumps = _stdlib_json_dumps
+    json_loads = json.loads  # accepts bytes or str
+
+def json_loads_file(data):
+    """Parse one of our own data files. Older builds wrote them with stdlib
+    json, which allows NaN, Infinity and lone surrogate escapes"""
+    try:
+        return json_loads(data)
+    except ValueError:
+        if json_loads is json.loads:
+            raise
+        return json.loads(data)
+
+def gzip_body(body):
+    """Gzip a cached response body once; None if that doesn't make it smaller"""
+    compressed = gzip.compress(body, 6)
+    return compressed if len(compressed) < len(body) else None
+
+def accepts_gzip(accept_encoding):
+    """True if an Accept-Encoding header allows gzip; a q=0 coding is a refusal"""
+    wildcard = False
+    for item in accept_encoding.split(','):
+        coding, *params = item.split(';')
+        coding = coding.strip().lower()
+        if coding not in ('gzip', 'x-gzip', '*'):
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding == '*':
+            wildcard = q > 0
+        else:
+            return q > 0  # an explicit gzip entry overrides the wildcard
+    return wildcard
+
+# Per-thread RNG so concurrent handler threads don't share one generator
+_rng_local = threading.local()
+
+def rng():
+    """This thread's random.Random instance"""
+    r = getattr(_rng_local, "r", None)
+    if r is None:
+        r = _rng_local.r = random.Random()
+    return r
+
+
+PATTERN_BASES = {
+    "easy": (1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 0, 1),
+    "medium": (1, 1, 1, 0, 1, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1),
+    "hard": (1, 1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 0, 1, 1, 0),
+    "brutal": (1, 0, 1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 1, 0),
+}
+PATTERN_VARIANT_BITS = 8  # 256 pre-shuffled patterns per tier
+
+def _shuffle_pattern(base):
+    r = rng()
+    pat = list(base)
+    for i in range(len(pat)-1, 0, -1):
+        if r.random() < 0.2:
+            j = max(0, i - r.randint(1, 3))
+            pat[i], pat[j] = pat[j], pat[i]
+    return tuple(pat)
+
+# Shuffled once at startup; a game turn just picks one
+_pattern_variants = {
+    tier: [_shuffle_pattern(base) for _ in range(1 << PATTERN_VARIANT_BITS)]
+    for tier, base in PATTERN_BASES.items()
+}
 
 def generate_pattern(level):
-    patterns = {
-        "easy": [1, 1, 1, 1, 0, 1, 1, 1, 0, 1, 1, 1, 1, 0, 1],
-        "medium": [1, 1, 1, 0, 1, 1, 0, 1, 1, 1, 0, 1, 0, 1, 1],
-        "hard": [1, 1, 0, 1, 1, 0, 1, 0, 1, 1, 0, 0, 1, 1, 0],
-        "brutal": [1, 0, 1, 1, 0, 0, 1, 0, 1, 0, 1, 1, 0, 1, 0],
-    }
+    r = rng()
     if level <= 4:
-        pat = list(patterns["easy"])
+        variants = _pattern_variants["easy"]
     elif level <= 10:
-        pat = list(patterns["medium"])
+        variants = _pattern_variants["medium"]
     elif level <= 16:
-        pat = list(patterns["hard"])
+        variants = _pattern_variants["hard"]
     else:
-        pat = list(patterns["brutal"])
-        
-    for i in range(len(pat)-1, 0, -1):
-        if random.random() < 0.2:
-            j = max(0, i - random.randint(1, 3))
-            pat[i], pat[j] = pat[j], pat[i]
-    return pat
+        variants = _pattern_variants["brutal"]
+    return variants[r.getrandbits(PATTERN_VARIANT_BITS)]
 
 def get_next_outcome(token):
     with game_lock:
         state = active_games.get(token)
         if not state:
             return 0
+        needs_pattern = "pattern" not in state or state["pattern_pos"] >= len(state["pattern"])
+        level = state["level"]
+    
+    # Pick the next pattern without holding game_lock
+    new_pattern = generate_pattern(level) if needs_pattern else None
+    
+    with game_lock:
+        # Re-check: a concurrent turn may have refilled or used up the pattern
         if "pattern" not in state or state["pattern_pos"] >= len(state["pattern"]):
-            state["pattern"] = generate_pattern(state["level"])
+            state["pattern"] = new_pattern or generate_pattern(state["level"])
             state["pattern_pos"] = 0
             
         result = state["pattern"][state["pattern_pos"]]
         state["pattern_pos"] += 1
+        money = state["money"]
+        streak = state["streak"]
         
-        if result == 1 and state["money"] > 500000 and random.random() < 0.15:
-            return 0
-        if result == 0 and state["streak"] >= 5 and random.random() < 0.1:
-            return 1
-            
-        return result
+    r = rng()
+    if result == 1 and money > 500000 and r.random() < 0.15:
+        return 0
+    if result == 0 and streak >= 5 and r.random() < 0.1:
+        return 1
+        
+    return result
 
 # ============================================================
 # CONFIG
@@ -68,89 +190,366 @@ def get_next_outcome(token):
 PORT = int(os.environ.get('PORT', 8080))
 DB_FILE = "greed_trial_db.json"
 TRIVIA_CACHE_FILE = "trivia_cache.json"
+INDEX_FILE = "index.html"
 
 # Rate limit: OpenTDB allows 1 request per 5 seconds
 TRIVIA_FETCH_DELAY = 6  # seconds between API calls
 TRIVIA_BATCH_SIZE = 50  # max per request
+OPENTDB_HOST = "opentdb.com"
+# RFC 3986 encoding is decoded with a plain unquote instead of html.unescape
+OPENTDB_QUESTIONS_PATH = "/api.php?amount={}&difficulty={}&type=multiple&encode=url3986"
 TRIVIA_MIN_CACHE = 10   # minimum before refetch attempt
+TRIVIA_SAVE_INTERVAL = 30  # min seconds between trivia cache writes
 
-# Leaderboard auto-refresh interval
-LEADERBOARD_REFRESH_INTERVAL = 60  # seconds (1 minute)
+# Leaderboard cache: rebuilt on read once scores changed or the TTL passed
+LEADERBOARD_REFRESH_INTERVAL = 60  # seconds (1 minute) TTL
+LEADERBOARD_MIN_REFRESH = 1  # seconds; caps inline rebuilds under load
+LEADERBOARD_SIZE = 100  # entries kept (and persisted in db["leaderboard"])
 
 # Auto-save interval for database
-DB_SAVE_INTERVAL = 30  # seconds
+DB_SAVE_INTERVAL = 5  # seconds to coalesce writes before flushing
+
+# Score submissions are queued and applied in batches by score_writer_thread
+SCORE_QUEUE_SIZE = 10000  # pending submissions before /api/score blocks
+SCORE_BATCH_SIZE = 64  # max submissions applied per db_lock acquisition
+SCORE_BATCH_WAIT = 0.05  # seconds to gather a batch after the first item
+MAX_STAT_VALUE = 2 ** 53  # per-submission cap; largest int JS clients hold exactly
+
+# Per-user game history ring buffer length
+GAME_HISTORY_SIZE = 20
+
+# Sessions expire after 24 hours; expired ones are swept in the background
+SESSION_TTL = 86400  # seconds
+SESSION_SWEEP_INTERVAL = 60  # seconds
+
+# Password hashing: scrypt on a small dedicated pool so logins can't tie up
+# every HTTP worker; n is tuned at startup between the two bounds
+SCRYPT_N_MIN = 2 ** 14  # 16 MiB per hash with r=8
+SCRYPT_N_MAX = 2 ** 15
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_TARGET = 0.05  # seconds per hash
+PASSWORD_HASH_WORKERS = 4
+
+# Largest POST body accepted; bigger requests get a 413 without being read
+MAX_BODY_SIZE = 65536  # bytes
+# Up to this much of a rejected body is read and dropped, for at most
+# MAX_DISCARD_TIME, so the client gets the 413 rather than a reset
+MAX_DISCARD_SIZE = 16 * 1024 * 1024  # bytes
+MAX_DISCARD_TIME = 2  # seconds
+
+# A connection gets REQUEST_TIMEOUT to deliver a request; between requests
+# on a kept-alive connection it may sit idle only KEEPALIVE_TIMEOUT
+REQUEST_TIMEOUT = 10  # seconds
+KEEPALIVE_TIMEOUT = 5  # seconds
+
+# Each connection gets its own thread, but at most this many requests are
+# processed at once; idle or slow-to-send connections don't take a slot
+MAX_CONCURRENT_REQUESTS = 32
+# Open connections (and so connection threads); past this, new sockets are
+# closed on accept instead of getting a thread
+MAX_CONNECTIONS = 256
 
 # ============================================================
-# DATABASE (simple JSON file with auto-save)
+# DATABASE (in-memory JSON document, flushed to file in background)
 # ============================================================
 db_lock = threading.Lock()
+db_write_lock = threading.Lock()  # serializes writers of DB_FILE
 active_games = {}
 game_lock = threading.Lock()
 
-# In-memory database with auto-save
+# In-memory database, flushed by db_autosave_thread when dirty
 _db_cache = None
-_db_dirty = False
+_db_dirty = threading.Event()
+
+# Leaderboard entries by username, plus their ranking as (-score, username)
+# tuples kept sorted with bisect and capped at LEADERBOARD_SIZE (both guarded
+# by db_lock); db["leaderboard"] is derived from these when the DB is flushed
+_lb_by_user = {}
+_lb_ranked = []
+
+# Pending (username, score, crashes, streak, extra_stats) submissions
+score_queue = queue.Queue(maxsize=SCORE_QUEUE_SIZE)
+
+# Min-heap of (expires_at, token) for the session sweep (guarded by db_lock)
+_session_expiry = []
 
 # Cached leaderboard for fast access
-cached_leaderboard = []
+cached_leaderboard_bytes = b""  # JSON body for /api/leaderboard
+cached_leaderboard_gzip = None  # gzip_body() of the above
+cached_leaderboard_ts = 0.0  # time.monotonic() of the last refresh
+cached_leaderboard_stale = threading.Event()  # set by score_writer_thread
 lb_lock = threading.Lock()
+lb_refresh_lock = threading.Lock()  # held by the thread rebuilding the cache
+
+# Password hashing pool and the scrypt cost picked by tune_scrypt()
+hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="hash")
+scrypt_n = SCRYPT_N_MIN
 
 def load_db():
-    """Load database from file"""
+    """Load database from file once; later calls return the in-memory copy"""
     global _db_cache
+    if _db_cache is not None:
+        return _db_cache  # per-request fast path, no lock needed
     with db_lock:
         if _db_cache is not None:
             return _db_cache
-            
+        
+        # Build everything in a local; readers on the lock-free path above
+        # must only ever see a fully normalized document
+        db = None
         if os.path.exists(DB_FILE):
             try:
-                with open(DB_FILE, "r") as f:
-                    _db_cache = json.load(f)
-                    print(f"[INFO] Loaded database: {len(_db_cache.get('users', {}))} users")
-                    return _db_cache
-            except Exception as e:
+                with open(DB_FILE, "rb") as f:
+                    loaded = json_loads_file(f.read())
+                if isinstance(loaded, dict):
+                    db = loaded
+                    print(f"[INFO] Loaded database: {len(db.get('users', {}))} users")
+                else:
+                    print(f"[WARN] Ignoring malformed database file")
+            except (OSError, ValueError) as e:
                 print(f"[WARN] Error loading database: {e}")
+            if db is None:
+                # Never let the first flush replace a file we couldn't read
+                aside = f"{DB_FILE}.unreadable.{int(time.time())}"
+                os.replace(DB_FILE, aside)  # raises rather than risk data loss
+                print(f"[WARN] Moved unreadable database to {aside}, starting empty")
         
-        _db_cache = {"users": {}, "sessions": {}, "leaderboard": []}
-        return _db_cache
+        if db is None:
+            db = {"users": {}, "sessions": {}, "leaderboard": []}
+        if _normalize_users(db):
+            _db_dirty.set()
+        for entry in db.get("leaderboard", []):
+            _lb_by_user[entry["username"]] = entry
+        _lb_ranked[:] = sorted((-e["score"], u) for u, e in _lb_by_user.items())
+        _trim_leaderboard()
+        for token, sess in db.get("sessions", {}).items():
+            _session_expiry.append((sess["created_at"] + SESSION_TTL, token))
+        heapq.heapify(_session_expiry)
+        _db_cache = db  # publish last
+        return db
 
-def save_db(data=None, force=False):
+def canonical_username(username):
+    """Usernames are case-insensitive and stored lowercase"""
+    return username.strip().lower()
+
+def _intern_keys(d):
+    return {sys.intern(k): v for k, v in d.items()}
+
+# Numeric fields of stored records; older stdlib-json files can hold NaN or
+# Infinity in them, and orjson would flush those back out as null
+_USER_NUMBERS = ("created_at", "high_score", "total_crashes", "total_games", "total_wins",
+                 "best_streak", "total_clicks", "total_cashouts", "peak_level",
+                 "total_play_time", "last_played")
+_HISTORY_NUMBERS = ("score", "crashes", "streak", "time", "level")
+_LEADERBOARD_NUMBERS = ("score", "crashes", "total_games", "total_wins", "best_streak", "time")
+
+def _finite(value):
+    """value if it is a finite real number; infinities clamp to +/-MAX_STAT_VALUE,
+    anything else (NaN, null, strings) becomes 0"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0
+    if isinstance(value, float) and not math.isfinite(value):
+        if math.isnan(value):
+            return 0
+        return MAX_STAT_VALUE if value > 0 else -MAX_STAT_VALUE
+    return value
+
+def _sanitize_numbers(record, fields):
+    """Make the given fields of record finite numbers; True if any changed"""
+    changed = False
+    for field in fields:
+        if field in record:
+            value = record[field]
+            fixed = _finite(value)
+            if fixed is not value:
+                record[field] = fixed
+                changed = True
+    return changed
+
+def _normalize_users(db):
+    """Intern user dict keys, re-key legacy users by canonical username and
+    replace non-finite numbers. Returns True if anything needs writing back."""
+    old_users = db.get("users", {})
+    users = {}
+    renamed = {}
+    fixed = False
+    for key, user in old_users.items():
+        user = _intern_keys(user)
+        user["game_history"] = deque(
+            (_intern_keys(g) for g in user.get("game_history", [])), maxlen=GAME_HISTORY_SIZE)
+        fixed = _sanitize_numbers(user, _USER_NUMBERS) or fixed
+        for game in user["game_history"]:
+            fixed = _sanitize_numbers(game, _HISTORY_NUMBERS) or fixed
+        canon = canonical_username(key)
+        if canon != key:
+            if canon in old_users or canon in users:
+                # Another account already owns the lowercase name; keep this
+                # one under its original key (get_user tries exact match first)
+                print(f"[WARN] Username collision, not renaming: {key}")
+                canon = key
+            else:
+                renamed[key] = canon
+                user["username"] = canon
+        users[canon] = user
+    db["users"] = users
+    
+    for sess in db.get("sessions", {}).values():
+        sess["username"] = renamed.get(sess["username"], sess["username"])
+    for sess in db.get("sessions", {}).values():
+        fixed = _sanitize_numbers(sess, ("created_at",)) or fixed
+    leaderboard = []
+    for entry in db.get("leaderboard", []):
+        if not isinstance(entry.get("username"), str):
+            fixed = True  # unusable entry; update_score recreates it
+            continue
+        entry["username"] = renamed.get(entry["username"], entry["username"])
+        entry.setdefault("score", 0)
+        fixed = _sanitize_numbers(entry, _LEADERBOARD_NUMBERS) or fixed
+        leaderboard.append(entry)
+    db["leaderboard"] = leaderboard
+    return bool(renamed) or fixed
+
+def write_file_atomic(path, data):
+    """Write bytes to a temporary file first, then rename (atomic operation)"""
+    temp_file = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(temp_file, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())  # data is on disk before the rename
+        os.replace(temp_file, path)
+    except OSError:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass
+        raise
+
+def mark_dirty():
+    """Flag the in-memory database for the next background flush"""
+    _db_dirty.set()
+
+def save_db(force=False):
     """Save database to file"""
-    global _db_cache, _db_dirty
-    with db_lock:
-        if data is not None:
-            _db_cache = data
-            _db_dirty = True
+    if not force and not _db_dirty.is_set():
+        return
+    with db_write_lock:
+        # Snapshot under db_lock, do the file I/O outside it
+        with db_lock:
+            if _db_cache is None:
+                return
+            _db_cache["leaderboard"] = leaderboard_top(LEADERBOARD_SIZE)
+            try:
+                payload = json_dumps(_db_cache)
+            except (TypeError, ValueError) as e:
+                # Stay dirty so the data is retried, not silently dropped
+                print(f"[ERROR] Failed to serialize database: {e}")
+                return
+            _db_dirty.clear()  # only once the snapshot is in hand
         
-        if not force and not _db_dirty:
-            return
-            
         try:
-            # Write to temporary file first, then rename (atomic operation)
-            temp_file = DB_FILE + ".tmp"
-            with open(temp_file, "w") as f:
-                json.dump(_db_cache, f, indent=2)
-            os.replace(temp_file, DB_FILE)
-            _db_dirty = False
-        except Exception as e:
+            write_file_atomic(DB_FILE, payload)
+        except OSError as e:
+            _db_dirty.set()  # retry on the next flush
             print(f"[ERROR] Failed to save database: {e}")
 
-def db_autosave_thread():
-    """Background thread to periodically save database"""
+def run_supervised(target):
+    """Run a background loop, restarting it if it dies on an unexpected error"""
     while True:
-        time.sleep(DB_SAVE_INTERVAL)
         try:
-            save_db(force=False)
-        except Exception as e:
-            print(f"[WARN] Autosave error: {e}")
+            target()
+        except Exception:
+            traceback.print_exc()
+            print(f"[WARN] {target.__name__} crashed, restarting in 5s")
+            time.sleep(5)
+
+def db_autosave_thread():
+    """Background thread to flush the database shortly after it changes"""
+    while True:
+        _db_dirty.wait()
+        time.sleep(DB_SAVE_INTERVAL)  # let writes in this window coalesce
+        save_db()
+
+def leaderboard_top(n):
+    """Top n leaderboard entries by score (caller must hold db_lock)"""
+    return [_lb_by_user[username] for _, username in _lb_ranked[:n]]
+
+def _trim_leaderboard():
+    for _, username in _lb_ranked[LEADERBOARD_SIZE:]:
+        del _lb_by_user[username]
+    del _lb_ranked[LEADERBOARD_SIZE:]
+
+def _rank_leaderboard_entry(username, old_score, new_score):
+    """Move a user's rank to new_score, old_score is None for new entries (caller holds db_lock)"""
+    if old_score is not None:
+        if old_score == new_score:
+            return
+        i = bisect.bisect_left(_lb_ranked, (-old_score, username))
+        del _lb_ranked[i]
+    bisect.insort(_lb_ranked, (-new_score, username))
+    _trim_leaderboard()
 
 def get_user(db, username):
-    return db.get("users", {}).get(username)
+    users = db.get("users", {})
+    return users.get(username) or users.get(canonical_username(username))
+
+def _scrypt(password, salt, n):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=SCRYPT_R, p=SCRYPT_P,
+                          maxmem=256 * SCRYPT_R * n, dklen=32)
+
+def tune_scrypt():
+    """Pick the largest n up to SCRYPT_N_MAX that hashes within SCRYPT_TARGET"""
+    global scrypt_n
+    n = SCRYPT_N_MIN
+    while n < SCRYPT_N_MAX:
+        start = time.perf_counter()
+        _scrypt("benchmark", b"\0" * 16, n)
+        if (time.perf_counter() - start) * 2 > SCRYPT_TARGET:
+            break
+        n *= 2
+    scrypt_n = n
+    print(f"[INFO] scrypt n={n}")
+
+def _hash_password(password):
+    salt = os.urandom(16)
+    n = scrypt_n
+    return f"scrypt${n}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${_scrypt(password, salt, n).hex()}"
+
+def _check_password(stored, password):
+    """Return (matches, needs_rehash) for a stored password hash"""
+    if stored.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt, digest = stored.split("$")
+            n, r, p = int(n), int(r), int(p)
+            salt, digest = bytes.fromhex(salt), bytes.fromhex(digest)
+            hashed = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                                    maxmem=256 * r * n, dklen=len(digest))
+        except ValueError:
+            return False, False
+        return hmac.compare_digest(digest, hashed), n < scrypt_n
+    # Legacy unsalted sha256 hex digest, upgraded on the next successful login
+    try:
+        digest = bytes.fromhex(stored)
+    except ValueError:
+        return False, False
+    hashed = hashlib.sha256(password.encode()).digest()
+    return hmac.compare_digest(digest, hashed), True
+
+def hash_password(password):
+    """Hash a new password on the hashing pool"""
+    return hash_pool.submit(_hash_password, password).result()
+
+def check_password(stored, password):
+    """Verify a password on the hashing pool"""
+    return hash_pool.submit(_check_password, stored, password).result()
 
 def create_user(db, username, password, emoji):
-    if username in db.get("users", {}):
-        return None
-    hashed = hashlib.sha256(password.encode()).hexdigest()
+    username = canonical_username(username)
+    with db_lock:
+        if username in db.get("users", {}):
+            return None  # skip the hash for names that are obviously taken
+    hashed = hash_password(password)
     user = {
         "username": username,
         "password_hash": hashed,
@@ -166,43 +565,78 @@ def create_user(db, username, password, emoji):
         "peak_level": 0,
         "total_play_time": 0,
         "last_played": 0,
-        "game_history": [],  # last 20 games
+        "game_history": deque(maxlen=GAME_HISTORY_SIZE),  # last 20 games
         "achievements": [],
     }
-    db.setdefault("users", {})[username] = user
-    save_db(db)
+    with db_lock:
+        users = db.setdefault("users", {})
+        if username in users:
+            return None
+        users[username] = user
+    mark_dirty()
     return user
 
 def auth_user(db, username, password):
     user = get_user(db, username)
     if not user:
         return None
-    hashed = hashlib.sha256(password.encode()).hexdigest()
-    if user["password_hash"] == hashed:
-        return user
-    return None
+    stored = user.get("password_hash")
+    if not isinstance(stored, str):
+        return None
+    matches, needs_rehash = check_password(stored, password)  # constant-time compare
+    if not matches:
+        return None
+    if needs_rehash:
+        hashed = hash_password(password)
+        with db_lock:
+            if user.get("password_hash") == stored:
+                user["password_hash"] = hashed
+        mark_dirty()
+    return user
 
 def create_session(db, username):
     token = str(uuid.uuid4())
-    db.setdefault("sessions", {})[token] = {
-        "username": username,
-        "created_at": time.time()
-    }
-    save_db(db)
+    now = time.time()
+    with db_lock:
+        db.setdefault("sessions", {})[token] = {
+            "username": username,
+            "created_at": now
+        }
+        heapq.heappush(_session_expiry, (now + SESSION_TTL, token))
+    mark_dirty()
     return token
 
 def get_session_user(db, token):
-    sess = db.get("sessions", {}).get(token)
+    sessions = db.get("sessions")
+    sess = sessions.get(token) if sessions and token and isinstance(token, str) else None
     if not sess:
         return None
-    # Sessions expire after 24 hours
-    if time.time() - sess["created_at"] > 86400:
-        del db["sessions"][token]
-        save_db(db)
+    if time.time() - sess["created_at"] > SESSION_TTL:
+        # Drop it from memory; the sweep/next flush persists the removal
+        with db_lock:
+            sessions.pop(token, None)
+        mark_dirty()
         return None
     return sess["username"]
 
+def session_sweep_thread():
+    """Background thread to drop expired sessions"""
+    while True:
+        time.sleep(SESSION_SWEEP_INTERVAL)
+        now = time.time()
+        removed = 0
+        with db_lock:
+            sessions = _db_cache.get("sessions", {}) if _db_cache else {}
+            while _session_expiry and _session_expiry[0][0] <= now:
+                _, token = heapq.heappop(_session_expiry)
+                if sessions.pop(token, None) is not None:
+                    removed += 1
+        if removed:
+            mark_dirty()
+            print(f"[INFO] Expired {removed} sessions")
+
 def update_score(db, username, score, crashes, streak, extra_stats=None):
+    """Record one finished game (caller must hold db_lock)"""
     user = get_user(db, username)
     if not user:
         return
@@ -223,41 +657,76 @@ def update_score(db, username, score, crashes, streak, extra_stats=None):
         user["total_play_time"] = user.get("total_play_time", 0) + extra_stats.get("play_time", 0)
         user["last_played"] = time.time()
     
-    # Store game history (last 20)
-    history = user.get("game_history", [])
-    history.append({
+    # Store game history (deque drops anything past the last 20)
+    user["game_history"].append({
         "score": score,
         "crashes": crashes,
         "streak": streak,
         "time": time.time(),
         "level": extra_stats.get("level", 0) if extra_stats else 0,
     })
-    user["game_history"] = history[-20:]  # keep last 20
     
     db["users"][username] = user
     
-    # Update leaderboard
-    lb = db.get("leaderboard", [])
-    filtered_lb = [entry for entry in lb if entry["username"] != username]
-    filtered_lb.append({
-        "username": username,
+    # Update leaderboard entry in place and re-rank it only if its score moved
+    entry = _lb_by_user.get(username)
+    old_score = entry["score"] if entry is not None else None
+    if entry is None:
+        entry = _lb_by_user[username] = {"username": username}
+    new_score = user.get("high_score", score)
+    entry.update({
         "emoji": user.get("emoji", "😀"),
-        "score": user.get("high_score", score),
+        "score": new_score,
         "crashes": user.get("total_crashes", crashes),
         "total_games": user.get("total_games", 1),
         "total_wins": user.get("total_wins", 0),
         "best_streak": user.get("best_streak", 0),
         "time": time.time()
     })
-    filtered_lb.sort(key=lambda x: -x["score"])
-    db["leaderboard"] = filtered_lb[:100]
-    save_db(db)
+    _rank_leaderboard_entry(username, old_score, new_score)
+
+def valid_stat(value):
+    """A submitted stat: a real number (not bool) within +/-MAX_STAT_VALUE.
+    Negative is allowed, the client's money can end below zero"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    return -MAX_STAT_VALUE <= value <= MAX_STAT_VALUE  # False for NaN as well
+
+def score_writer_thread():
+    """Background thread applying queued score submissions in batches"""
+    db = load_db()
+    while True:
+        batch = [score_queue.get()]
+        deadline = time.monotonic() + SCORE_BATCH_WAIT
+        while len(batch) < SCORE_BATCH_SIZE:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(score_queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        try:
+            with db_lock:
+                for item in batch:
+                    try:
+                        update_score(db, *item)
+                    except (TypeError, ValueError) as e:
+                        print(f"[WARN] Dropped bad score for {item[0]}: {e}")
+            mark_dirty()
+            cached_leaderboard_stale.set()
+        finally:
+            for _ in batch:
+                score_queue.task_done()
 
 def get_user_stats(db, username):
     """Get detailed stats for a specific user"""
     user = get_user(db, username)
     if not user:
         return None
+    with db_lock:
+        # Copy under the lock; iterating a deque that update_score appends to raises
+        history = list(user.get("game_history", ()))[-10:]
     return {
         "username": username,
         "emoji": user.get("emoji", "😀"),
@@ -271,27 +740,39 @@ def get_user_stats(db, username):
         "peak_level": user.get("peak_level", 0),
         "total_play_time": user.get("total_play_time", 0),
         "last_played": user.get("last_played", 0),
-        "game_history": user.get("game_history", [])[-10:],
+        "game_history": history,
     }
 
 def refresh_leaderboard():
-    """Refresh the cached leaderboard from DB"""
-    global cached_leaderboard
-    db = load_db()
-    lb = db.get("leaderboard", [])
-    lb.sort(key=lambda x: -x.get("score", 0))
+    """Refresh the cached leaderboard from the in-memory leaderboard map"""
+    global cached_leaderboard_bytes, cached_leaderboard_gzip, cached_leaderboard_ts
+    # Clear first so a score landing during the rebuild marks it stale again
+    cached_leaderboard_stale.clear()
+    with db_lock:
+        lb = [dict(e) for e in leaderboard_top(20)]  # detach from live entries
+    # /api/leaderboard body, serialized once per refresh
+    body = json_dumps({"success": True, "leaderboard": lb})
+    gzipped = gzip_body(body)
     with lb_lock:
-        cached_leaderboard = lb[:50]
+        cached_leaderboard_bytes = body
+        cached_leaderboard_gzip = gzipped
+        cached_leaderboard_ts = time.monotonic()
 
-def leaderboard_refresh_thread():
-    """Background thread to refresh leaderboard every minute"""
-    while True:
-        try:
-            refresh_leaderboard()
-            print(f"[INFO] Leaderboard refreshed: {len(cached_leaderboard)} entries")
-        except Exception as e:
-            print(f"[WARN] Leaderboard refresh error: {e}")
-        time.sleep(LEADERBOARD_REFRESH_INTERVAL)
+def get_leaderboard_bytes():
+    """(body, gzipped body) of the leaderboard response, rebuilt inline if scores
+    changed or it has expired"""
+    age = time.monotonic() - cached_leaderboard_ts
+    if age >= LEADERBOARD_REFRESH_INTERVAL or (
+            cached_leaderboard_stale.is_set() and age >= LEADERBOARD_MIN_REFRESH):
+        # One thread rebuilds; concurrent readers keep serving the current
+        # bytes unless there are none yet
+        if lb_refresh_lock.acquire(blocking=not cached_leaderboard_bytes):
+            try:
+                refresh_leaderboard()
+            finally:
+                lb_refresh_lock.release()
+    with lb_lock:
+        return cached_leaderboard_bytes, cached_leaderboard_gzip
 
 # ============================================================
 # TRIVIA QUESTION SYSTEM
@@ -386,83 +867,170 @@ FALLBACK_HARD = [
 # TRIVIA CACHE with robust fetching and persistence
 # ============================================================
 trivia_cache = {"easy": [], "medium": [], "hard": []}
+# Question text -> answer pool tuple for every cached question, per
+# difficulty; doubles as the O(1) dedup index
+trivia_seen = {"easy": {}, "medium": {}, "hard": {}}
+# len(trivia_cache[difficulty]), kept current by the two mutators below so
+# /api/health can read it without trivia_lock
+trivia_counts = {"easy": 0, "medium": 0, "hard": 0}
 trivia_lock = threading.Lock()
+trivia_save_lock = threading.Lock()  # serializes writers of TRIVIA_CACHE_FILE
+opentdb_lock = threading.Lock()  # guards the OpenTDB connection, token and rate limit
+_opentdb_conn = None  # reused HTTPS connection
+_opentdb_token = None  # OpenTDB session token
+_trivia_last_save = 0.0  # time.monotonic() of the last write
+_trivia_dirty = False  # a save was skipped by the rate limit
 last_fetch_time = 0
 
+def answer_pool(q):
+    """All answers of a question as one tuple, correct answer last"""
+    return (*q["incorrect_answers"], q["correct_answer"])
+
+def reset_trivia_pool(difficulty, questions):
+    """Replace a difficulty's questions (caller holds trivia_lock or is starting up)"""
+    pool = trivia_cache[difficulty] = list(questions)
+    trivia_seen[difficulty] = {q["question"]: answer_pool(q) for q in pool}
+    trivia_counts[difficulty] = len(pool)
+
+def add_trivia_questions(difficulty, questions):
+    """Append questions not already cached, returns how many were added (caller holds trivia_lock)"""
+    pool = trivia_cache.setdefault(difficulty, [])
+    seen = trivia_seen.setdefault(difficulty, {})
+    added = 0
+    for q in questions:
+        if q["question"] not in seen:
+            seen[q["question"]] = answer_pool(q)
+            pool.append(q)
+            added += 1
+    trivia_counts[difficulty] = len(pool)
+    return added
+
 def load_trivia_cache():
     global trivia_cache
     if os.path.exists(TRIVIA_CACHE_FILE):
         try:
-            with open(TRIVIA_CACHE_FILE, "r") as f:
-                cached = json.load(f)
+            with open(TRIVIA_CACHE_FILE, "rb") as f:
+                cached = json_loads_file(f.read())
                 if isinstance(cached, dict):
-                    trivia_cache = cached
+                    trivia_cache = {}
+                    trivia_counts.clear()
+                    for diff, questions in cached.items():
+                        reset_trivia_pool(diff, questions)
                     print(f"[INFO] Loaded trivia cache: easy={len(trivia_cache.get('easy', []))}, medium={len(trivia_cache.get('medium', []))}, hard={len(trivia_cache.get('hard', []))}")
                     return
-        except Exception as e:
+        except (OSError, ValueError, KeyError, TypeError) as e:
             print(f"[WARN] Could not load trivia cache: {e}")
     
     # Initialize with fallbacks
-    trivia_cache = {
-        "easy": list(FALLBACK_EASY),
-        "medium": list(FALLBACK_MEDIUM),
-        "hard": list(FALLBACK_HARD),
-    }
-    save_trivia_cache()
+    trivia_cache = {}
+    trivia_counts.clear()
+    reset_trivia_pool("easy", FALLBACK_EASY)
+    reset_trivia_pool("medium", FALLBACK_MEDIUM)
+    reset_trivia_pool("hard", FALLBACK_HARD)
     print(f"[INFO] Initialized trivia cache with fallbacks: easy={len(trivia_cache['easy'])}, medium={len(trivia_cache['medium'])}, hard={len(trivia_cache['hard'])}")
 
-def save_trivia_cache():
-    try:
-        temp_file = TRIVIA_CACHE_FILE + ".tmp"
-        with open(temp_file, "w") as f:
-            json.dump(trivia_cache, f, indent=2)
-        os.replace(temp_file, TRIVIA_CACHE_FILE)
-    except Exception as e:
-        print(f"[WARN] Could not save trivia cache: {e}")
-
-def fetch_trivia_from_api(difficulty, amount=30):
-    """Fetch from OpenTDB with rate limiting and error handling"""
-    global last_fetch_time
-    
-    # Rate limiting
-    now = time.time()
-    wait = TRIVIA_FETCH_DELAY - (now - last_fetch_time)
+def save_trivia_cache(force=False):
+    """Persist the trivia cache, at most once per TRIVIA_SAVE_INTERVAL unless forced"""
+    global _trivia_last_save, _trivia_dirty
+    with trivia_save_lock:
+        if not force and time.monotonic() - _trivia_last_save < TRIVIA_SAVE_INTERVAL:
+            _trivia_dirty = True  # written by the next save
+            return
+        with trivia_lock:
+            payload = json_dumps(trivia_cache)
+            _trivia_dirty = False
+        try:
+            write_file_atomic(TRIVIA_CACHE_FILE, payload)
+            _trivia_last_save = time.monotonic()
+        except OSError as e:
+            _trivia_dirty = True
+            print(f"[WARN] Could not save trivia cache: {e}")
+
+def _opentdb_get(path):
+    """GET a path from OpenTDB over the shared keep-alive connection (caller holds opentdb_lock)"""
+    global _opentdb_conn
+    for attempt in range(2):
+        if _opentdb_conn is None:
+            _opentdb_conn = http.client.HTTPSConnection(OPENTDB_HOST, timeout=10)
+        try:
+            _opentdb_conn.request("GET", path, headers={"User-Agent": "GreedTrial/1.0"})
+            resp = _opentdb_conn.getresponse()
+            body = resp.read()
+        except (http.client.HTTPException, OSError):
+            # Server may have closed the idle connection; reconnect once
+            _opentdb_conn.close()
+            _opentdb_conn = None
+            if attempt:
+                raise
+            continue
+        if resp.status != 200:
+            raise http.client.HTTPException(f"HTTP {resp.status}")
+        return json_loads(body)
+
+def _opentdb_wait():
+    """Sleep until OpenTDB's rate limit allows another call"""
+    wait = TRIVIA_FETCH_DELAY - (time.time() - last_fetch_time)
     if wait > 0:
         time.sleep(wait)
+
+def fetch_trivia_from_api(difficulty, amount=TRIVIA_BATCH_SIZE):
+    """Fetch from OpenTDB with rate limiting and error handling"""
+    global last_fetch_time, _opentdb_token
     
-    try:
-        url = f"https://opentdb.com/api.php?amount={amount}&difficulty={difficulty}&type=multiple"
-        req = urllib.request.Request(url)
-        req.add_header('User-Agent', 'GreedTrial/1.0')
-        
-        with urllib.request.urlopen(req, timeout=10) as resp:
+    with opentdb_lock:
+        try:
+            # Session token makes OpenTDB skip questions we already got
+            if _opentdb_token is None:
+                _opentdb_wait()
+                data = _opentdb_get("/api_token.php?command=request")
+                last_fetch_time = time.time()
+                if data.get("response_code") == 0:
+                    _opentdb_token = data.get("token")
+            
+            _opentdb_wait()
+            path = OPENTDB_QUESTIONS_PATH.format(amount, difficulty)
+            if _opentdb_token:
+                path += f"&token={_opentdb_token}"
+            data = _opentdb_get(path)
             last_fetch_time = time.time()
-            data = json.loads(resp.read().decode())
             
             if data.get("response_code") == 0:
+                unquote = urllib.parse.unquote
                 questions = []
                 for q in data.get("results", []):
                     questions.append({
-                        "question": html.unescape(q["question"]),
-                        "correct_answer": html.unescape(q["correct_answer"]),
-                        "incorrect_answers": [html.unescape(a) for a in q["incorrect_answers"]],
-                        "category": html.unescape(q.get("category", "General")),
+                        "question": unquote(q["question"]),
+                        "correct_answer": unquote(q["correct_answer"]),
+                        "incorrect_answers": [unquote(a) for a in q["incorrect_answers"]],
+                        "category": unquote(q.get("category", "General")),
                     })
                 return questions
             elif data.get("response_code") == 5:
                 print(f"[WARN] Rate limited by OpenTDB API")
                 last_fetch_time = time.time() + 10  # Extra wait
                 return []
+            elif data.get("response_code") == 4:
+                # Token has handed out every question; reset it for next time
+                print(f"[INFO] OpenTDB session token exhausted, resetting")
+                _opentdb_wait()
+                _opentdb_get(f"/api_token.php?command=reset&token={_opentdb_token}")
+                last_fetch_time = time.time()
+                return []
+            elif data.get("response_code") == 3:
+                # Token expired (unused for 6 hours); request a new one next time
+                _opentdb_token = None
+                return []
             else:
                 print(f"[WARN] OpenTDB returned code {data.get('response_code')}")
                 return []
-    except HTTPError as e:
-        print(f"[WARN] Trivia API HTTP error: {e.code}")
-        last_fetch_time = time.time() + 10
-        return []
-    except (URLError, Exception) as e:
-        print(f"[WARN] Trivia API error: {e}")
-        return []
+        except http.client.HTTPException as e:
+            print(f"[WARN] Trivia API HTTP error: {e}")
+            last_fetch_time = time.time() + 10
+            return []
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # Network/timeout errors, bad JSON or unexpected result shape
+            print(f"[WARN] Trivia API error: {e}")
+            return []
 
 def prefetch_trivia():
     """Background thread to keep cache full"""
@@ -472,7 +1040,7 @@ def prefetch_trivia():
     with trivia_lock:
         for diff, fallback in [("easy", FALLBACK_EASY), ("medium", FALLBACK_MEDIUM), ("hard", FALLBACK_HARD)]:
             if len(trivia_cache.get(diff, [])) < TRIVIA_MIN_CACHE:
-                trivia_cache[diff] = list(fallback)
+                reset_trivia_pool(diff, fallback)
     
     # Then try API
     for difficulty in ["easy", "medium", "hard"]:
@@ -484,23 +1052,19 @@ def prefetch_trivia():
             continue
             
         print(f"[INFO] Fetching {difficulty} questions from API...")
-        questions = fetch_trivia_from_api(difficulty, 30)
+        questions = fetch_trivia_from_api(difficulty)
         
         if questions:
             with trivia_lock:
                 # Merge with existing, deduplicate by question text
-                existing_qs = {q["question"] for q in trivia_cache.get(difficulty, [])}
-                new_qs = [q for q in questions if q["question"] not in existing_qs]
-                trivia_cache[difficulty] = trivia_cache.get(difficulty, []) + new_qs
-                print(f"[INFO] {difficulty}: added {len(new_qs)} new, total {len(trivia_cache[difficulty])}")
+                added = add_trivia_questions(difficulty, questions)
+                print(f"[INFO] {difficulty}: added {added} new, total {len(trivia_cache[difficulty])}")
         else:
             # Ensure fallbacks are loaded
             with trivia_lock:
                 fallback = {"easy": FALLBACK_EASY, "medium": FALLBACK_MEDIUM, "hard": FALLBACK_HARD}[difficulty]
                 if len(trivia_cache.get(difficulty, [])) < len(fallback):
-                    existing_qs = {q["question"] for q in trivia_cache.get(difficulty, [])}
-                    new_fb = [q for q in fallback if q["question"] not in existing_qs]
-                    trivia_cache[difficulty] = trivia_cache.get(difficulty, []) + new_fb
+                    add_trivia_questions(difficulty, fallback)
                 print(f"[INFO] {difficulty}: using {len(trivia_cache[difficulty])} questions (fallback)")
         
         time.sleep(TRIVIA_FETCH_DELAY)
@@ -512,46 +1076,42 @@ def refetch_thread():
     """Periodically refetch trivia in background"""
     while True:
         time.sleep(300)  # Every 5 minutes
-        try:
-            for difficulty in ["easy", "medium", "hard"]:
-                with trivia_lock:
-                    count = len(trivia_cache.get(difficulty, []))
-                if count < 15:
-                    qs = fetch_trivia_from_api(difficulty, 20)
-                    if qs:
-                        with trivia_lock:
-                            existing = {q["question"] for q in trivia_cache.get(difficulty, [])}
-                            new_qs = [q for q in qs if q["question"] not in existing]
-                            trivia_cache[difficulty] = trivia_cache.get(difficulty, []) + new_qs
-                        save_trivia_cache()
-                    time.sleep(TRIVIA_FETCH_DELAY)
-        except:
-            pass
+        changed = _trivia_dirty
+        for difficulty in ["easy", "medium", "hard"]:
+            with trivia_lock:
+                count = len(trivia_cache.get(difficulty, []))
+            if count < 15:
+                qs = fetch_trivia_from_api(difficulty)
+                if qs:
+                    with trivia_lock:
+                        changed = add_trivia_questions(difficulty, qs) > 0 or changed
+                time.sleep(TRIVIA_FETCH_DELAY)
+        # One write for all difficulties
+        if changed:
+            save_trivia_cache()
 
 def get_trivia_question(difficulty="easy", count=1):
     """Get question(s) from cache, with guaranteed fallback"""
+    r = rng()
     with trivia_lock:
         pool = trivia_cache.get(difficulty, [])
         if not pool:
             # Emergency fallback
             fallback = {"easy": FALLBACK_EASY, "medium": FALLBACK_MEDIUM, "hard": FALLBACK_HARD}
             pool = fallback.get(difficulty, FALLBACK_EASY)
-            trivia_cache[difficulty] = list(pool)
+            if difficulty in fallback:
+                reset_trivia_pool(difficulty, pool)
         
-        if count >= len(pool):
-            selected = list(pool)
-            random.shuffle(selected)
-        else:
-            selected = random.sample(pool, count)
+        selected = r.sample(pool, min(count, len(pool)))
+        answer_pools = trivia_seen.get(difficulty, {})
         
         # Format for client
         result = []
         for q in selected:
-            answers = list(q["incorrect_answers"]) + [q["correct_answer"]]
-            random.shuffle(answers)
+            answers = answer_pools.get(q["question"]) or answer_pool(q)
             result.append({
                 "question": q["question"],
-                "answers": answers,
+                "answers": r.sample(answers, len(answers)),  # shuffled copy
                 "correct": q["correct_answer"],
                 "category": q.get("category", "General"),
             })
@@ -560,120 +1120,117 @@ def get_trivia_question(difficulty="easy", count=1):
 # ============================================================
 # GRAPH PREDICTION DATA GENERATOR
 # ============================================================
+GRAPH_ASSET_NAMES = (
+    "GREED/USD", "COPE/BTC", "FOMO.X", "REKT-ETF",
+    "PUMP&DUMP", "BAGS.IO", "MOON/SOL", "RUG.PULL"
+)
+
 def generate_graph_data():
     """Generate a fake stock/crypto chart with a hidden outcome"""
-    # Generate 20 historical points
-    points = [100]
-    for i in range(19):
-        change = random.uniform(-8, 8)
-        # Add some trend
-        if random.random() < 0.6:
-            change += random.uniform(-2, 2)
-        points.append(max(10, points[-1] + change))
+    r = rng()
+    uniform = r.uniform
+    rand = r.random
+    # 19 price changes, 60% of them with some extra trend
+    changes = [uniform(-8, 8) + (uniform(-2, 2) if rand() < 0.6 else 0) for _ in range(19)]
+    # Generate 20 historical points, clamped at 10 after every step
+    points = list(itertools.accumulate(changes, lambda p, c: max(10, p + c), initial=100))
     
     # Decide actual outcome (slightly weighted by recent trend)
     recent_trend = points[-1] - points[-5] if len(points) >= 5 else 0
     if recent_trend > 5:
         # Was going up - 45% chance continues (trap!)
-        goes_up = random.random() < 0.45
+        goes_up = r.random() < 0.45
     elif recent_trend < -5:
         # Was going down - 45% chance continues
-        goes_up = random.random() > 0.45
+        goes_up = r.random() > 0.45
     else:
-        goes_up = random.random() < 0.5
+        goes_up = r.random() < 0.5
     
     # Generate the "reveal" points
-    reveal = [points[-1]]
-    for i in range(5):
-        if goes_up:
-            reveal.append(reveal[-1] + random.uniform(1, 8))
-        else:
-            reveal.append(max(5, reveal[-1] - random.uniform(1, 8)))
+    steps = [uniform(1, 8) for _ in range(5)]
+    if goes_up:
+        reveal = list(itertools.accumulate(steps, operator.add, initial=points[-1]))
+    else:
+        reveal = list(itertools.accumulate(steps, lambda p, c: max(5, p - c), initial=points[-1]))
     
     return {
         "history": [round(p, 2) for p in points],
         "reveal": [round(p, 2) for p in reveal],
         "goes_up": goes_up,
-        "asset_name": random.choice([
-            "GREED/USD", "COPE/BTC", "FOMO.X", "REKT-ETF",
-            "PUMP&DUMP", "BAGS.IO", "MOON/SOL", "RUG.PULL"
-        ])
+        "asset_name": r.choice(GRAPH_ASSET_NAMES)
     }
 
 # ============================================================
 # BITCOIN INVESTMENT GENERATOR
 # ============================================================
-def generate_bitcoin_opportunity():
-    """Generate a Bitcoin/crypto investment opportunity that backfires 67% of the time"""
-    opportunities = [
-        {
-            "name": "🪙 Bitcoin Flash Dip",
-            "desc": "BTC dropped 12% in 2 hours. Buy the dip?",
-            "invest_msg": "You bought the dip!",
-            "skip_msg": "You played it safe.",
-            "backfire_chance": 0.67,
-            "win_mult": 2.5,
-            "lose_mult": 0.3,
-            "win_msg": "📈 BTC recovered! Your investment 2.5x'd!",
-            "lose_msg": "📉 BTC kept dropping. Lost 70% of your investment. The dip keeps dipping.",
-        },
-        {
-            "name": "🐕 MemeCoin Launch",
-            "desc": "New memecoin '$GREED' just launched. 10,000% potential?",
-            "invest_msg": "You aped in!",
-            "skip_msg": "FOMO avoided.",
-            "backfire_chance": 0.67,
-            "win_mult": 5.0,
-            "lose_mult": 0.1,
-            "win_msg": "🚀 $GREED mooned! 5x return! (this never happens)",
-            "lose_msg": "🔻 Rug pulled. Dev sold everything. Lost 90%. Classic.",
-        },
-        {
-            "name": "⛏️ Mining Contract",
-            "desc": "Cloud mining contract: 'Guaranteed 200% APY'. Legit?",
-            "invest_msg": "You signed the contract!",
-            "skip_msg": "Smart move, probably.",
-            "backfire_chance": 0.67,
-            "win_mult": 2.0,
-            "lose_mult": 0.2,
-            "win_msg": "⛏️ Actually paid out! Mining profits doubled your money!",
-            "lose_msg": "🏃 Mining company vanished overnight. Ponzi scheme confirmed. -80%",
-        },
-        {
-            "name": "🎰 Leverage Trade",
-            "desc": "50x leverage on ETH. 'I can feel it going up.'",
-            "invest_msg": "You opened a 50x long!",
-            "skip_msg": "Leverage dodged.",
-            "backfire_chance": 0.67,
-            "win_mult": 4.0,
-            "lose_mult": 0.05,
-            "win_msg": "📈 ETH pumped! 50x leverage = 4x gains! Diamond hands!",
-            "lose_msg": "💀 Liquidated in 3 minutes. Lost 95%. Shoulda used a stop-loss.",
-        },
-        {
-            "name": "🌊 NFT Flip",
-            "desc": "Floor price dropping. 'Buy the fear, sell the greed'?",
-            "invest_msg": "You bought the NFT!",
-            "skip_msg": "NFTs avoided.",
-            "backfire_chance": 0.67,
-            "win_mult": 3.0,
-            "lose_mult": 0.15,
-            "win_msg": "🎨 Celebrity tweeted about it! 3x flip!",
-            "lose_msg": "💩 Collection delisted. Your JPEG is worthless. -85%",
-        },
-        {
-            "name": "🏦 DeFi Yield Farm",
-            "desc": "New DeFi protocol offering 500% APY. 'Audited by us.'",
-            "invest_msg": "You staked your tokens!",
-            "skip_msg": "DeFi dodged.",
-            "backfire_chance": 0.67,
-            "win_mult": 2.5,
-            "lose_mult": 0.1,
-            "win_msg": "🌾 Protocol survived! Your yield farming paid off!",
-            "lose_msg": "🐛 Smart contract exploit. Funds drained. Welcome to DeFi.",
-        },
-    ]
-    return random.choice(opportunities)
+BITCOIN_OPPORTUNITIES = [
+    {
+        "name": "🪙 Bitcoin Flash Dip",
+        "desc": "BTC dropped 12% in 2 hours. Buy the dip?",
+        "invest_msg": "You bought the dip!",
+        "skip_msg": "You played it safe.",
+        "backfire_chance": 0.67,
+        "win_mult": 2.5,
+        "lose_mult": 0.3,
+        "win_msg": "📈 BTC recovered! Your investment 2.5x'd!",
+        "lose_msg": "📉 BTC kept dropping. Lost 70% of your investment. The dip keeps dipping.",
+    },
+    {
+        "name": "🐕 MemeCoin Launch",
+        "desc": "New memecoin '$GREED' just launched. 10,000% potential?",
+        "invest_msg": "You aped in!",
+        "skip_msg": "FOMO avoided.",
+        "backfire_chance": 0.67,
+        "win_mult": 5.0,
+        "lose_mult": 0.1,
+        "win_msg": "🚀 $GREED mooned! 5x return! (this never happens)",
+        "lose_msg": "🔻 Rug pulled. Dev sold everything. Lost 90%. Classic.",
+    },
+    {
+        "name": "⛏️ Mining Contract",
+        "desc": "Cloud mining contract: 'Guaranteed 200% APY'. Legit?",
+        "invest_msg": "You signed the contract!",
+        "skip_msg": "Smart move, probably.",
+        "backfire_chance": 0.67,
+        "win_mult": 2.0,
+        "lose_mult": 0.2,
+        "win_msg": "⛏️ Actually paid out! Mining profits doubled your money!",
+        "lose_msg": "🏃 Mining company vanished overnight. Ponzi scheme confirmed. -80%",
+    },
+    {
+        "name": "🎰 Leverage Trade",
+        "desc": "50x leverage on ETH. 'I can feel it going up.'",
+        "invest_msg": "You opened a 50x long!",
+        "skip_msg": "Leverage dodged.",
+        "backfire_chance": 0.67,
+        "win_mult": 4.0,
+        "lose_mult": 0.05,
+        "win_msg": "📈 ETH pumped! 50x leverage = 4x gains! Diamond hands!",
+        "lose_msg": "💀 Liquidated in 3 minutes. Lost 95%. Shoulda used a stop-loss.",
+    },
+    {
+        "name": "🌊 NFT Flip",
+        "desc": "Floor price dropping. 'Buy the fear, sell the greed'?",
+        "invest_msg": "You bought the NFT!",
+        "skip_msg": "NFTs avoided.",
+        "backfire_chance": 0.67,
+        "win_mult": 3.0,
+        "lose_mult": 0.15,
+        "win_msg": "🎨 Celebrity tweeted about it! 3x flip!",
+        "lose_msg": "💩 Collection delisted. Your JPEG is worthless. -85%",
+    },
+    {
+        "name": "🏦 DeFi Yield Farm",
+        "desc": "New DeFi protocol offering 500% APY. 'Audited by us.'",
+        "invest_msg": "You staked your tokens!",
+        "skip_msg": "DeFi dodged.",
+        "backfire_chance": 0.67,
+        "win_mult": 2.5,
+        "lose_mult": 0.1,
+        "win_msg": "🌾 Protocol survived! Your yield farming paid off!",
+        "lose_msg": "🐛 Smart contract exploit. Funds drained. Welcome to DeFi.",
+    },
+]
 
 # ============================================================
 # PERSONAL QUESTIONS (the mean ones)
@@ -753,234 +1310,402 @@ PERSONAL_QUESTIONS = [
     },
 ]
 
+# The payloads above never change, so each response body is serialized once
+# and handlers pick one by integer index instead of touching the dicts
+_BITCOIN_BYTES = [json_dumps({"success": True, "opportunity": o}) for o in BITCOIN_OPPORTUNITIES]
+_PERSONAL_BYTES = [json_dumps({"success": True, "question": q}) for q in PERSONAL_QUESTIONS]
+_BITCOIN_GZIP = [gzip_body(b) for b in _BITCOIN_BYTES]
+_PERSONAL_GZIP = [gzip_body(b) for b in _PERSONAL_BYTES]
+_N_BITCOIN = len(_BITCOIN_BYTES)
+_N_PERSONAL = len(_PERSONAL_BYTES)
+
+# ============================================================
+# STATIC PAGE (read once, served from memory)
+# ============================================================
+_index_bytes = None
+_index_gzip = None
+_index_mtime = 0  # whole seconds, as sent in Last-Modified
+_index_last_modified = ""
+
+def load_index():
+    """Read index.html into memory"""
+    global _index_bytes, _index_gzip, _index_mtime, _index_last_modified
+    try:
+        with open(INDEX_FILE, 'rb') as f:
+            data = f.read()
+            mtime = int(os.fstat(f.fileno()).st_mtime)
+    except OSError as e:
+        print(f"[WARN] Could not read {INDEX_FILE}: {e}")
+        return
+    _index_mtime = mtime
+    _index_last_modified = email.utils.formatdate(mtime, usegmt=True)
+    _index_gzip = gzip_body(data)
+    _index_bytes = data
+
+def index_not_modified(if_modified_since):
+    """True if an If-Modified-Since header covers the cached index.html"""
+    if not if_modified_since:
+        return False
+    try:
+        since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return _index_mtime <= since.timestamp()
+
 # ============================================================
 # HTTP HANDLER
 # ============================================================
+def str_field(data, key):
+    """data[key] if it is a string, else '' (so non-strings fail the required check)"""
+    value = data.get(key, '')
+    return value if isinstance(value, str) else ''
+
+request_slots = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
 class GreedHandler(SimpleHTTPRequestHandler):
+    # Persistent connections; every response must carry Content-Length
+    protocol_version = "HTTP/1.1"
+    timeout = REQUEST_TIMEOUT
+    
+    def handle_one_request(self):
+        self.holds_slot = False
+        try:
+            super().handle_one_request()
+        finally:
+            if self.holds_slot:
+                request_slots.release()
+        if not self.close_connection:
+            self.connection.settimeout(KEEPALIVE_TIMEOUT)  # idle until the next request
+    
+    def parse_request(self):
+        self.connection.settimeout(self.timeout)  # a request is arriving
+        # The request line and headers have arrived; only now wait for a slot
+        if not super().parse_request():
+            return False
+        request_slots.acquire()
+        self.holds_slot = True
+        return True
     
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def send_json(self, data, status=200):
+        self.send_raw_json(json_dumps(data), status)
+    
+    def pick_encoding(self, body, gzipped):
+        """Choose the gzipped variant if the client takes it; call after send_response"""
+        if gzipped is None:
+            return body
+        self.send_header('Vary', 'Accept-Encoding')
+        if accepts_gzip(self.headers.get('Accept-Encoding', '')):
+            self.send_header('Content-Encoding', 'gzip')
+            return gzipped
+        return body
+    
+    def send_raw_json(self, body, status=200, gzipped=None):
+        """Send an already-serialized JSON body, or its precompressed variant"""
         self.send_response(status)
+        body = self.pick_encoding(body, gzipped)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Cache-Control', 'no-cache')
+        if self.close_connection:
+            self.send_header('Connection', 'close')
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(body)
     
-    def read_json(self):
-        length = int(self.headers.get('Content-Length', 0))
-        if length == 0:
+    def discard_body(self, length):
+        """Read and drop an unwanted request body, within MAX_DISCARD_SIZE/TIME"""
+        remaining = min(length, MAX_DISCARD_SIZE)
+        deadline = time.monotonic() + MAX_DISCARD_TIME
+        try:
+            self.connection.settimeout(MAX_DISCARD_TIME)
+            while remaining > 0 and time.monotonic() < deadline:
+                chunk = self.rfile.read1(min(remaining, 65536))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+        except OSError:
+            pass
+    
+    def body_length(self):
+        """Declared Content-Length, 0 if missing or malformed"""
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or (length == 0 and 'Transfer-Encoding' in self.headers):
+            # Can't tell where this body ends, so don't reuse the connection;
+            # send_raw_json adds the matching Connection: close
+            self.close_connection = True
+            return 0
+        return length
+    
+    def session_user(self, data):
+        """(db, username) for the body's session token; username is None if not logged in"""
+        token = data['token'] if 'token' in data else data.get('session', '')
+        db = load_db()
+        return db, get_session_user(db, token)
+    
+    def read_json(self, length):
+        """Parse the request body as a JSON object; None if it isn't one"""
+        if not length:
             return {}
         body = self.rfile.read(length)
         try:
-            return json.loads(body.decode())
-        except:
-            return {}
+            data = json_loads(body)  # parses the raw bytes, no str copy
+        except ValueError:  # bad JSON or not UTF-8
+            return None
+        return data if isinstance(data, dict) else None
     
     def do_GET(self):
-        path = self.path.split('?')[0]
+        path, _, self.query_string = self.path.partition('?')
+        route = self._GET_ROUTES.get(path)
+        if route is not None:
+            route(self)
+            return
         
-        if path == '/':
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/html; charset=utf-8')
+        # Serve static files
+        super().do_GET()
+    
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        length = self.body_length()
+        if length > MAX_BODY_SIZE:
+            self.close_connection = True  # the body is never parsed
+            self.send_json({"success": False, "error": "Request body too large"}, 413)
+            self.discard_body(length)
+            return
+        data = self.read_json(length)
+        route = self._POST_ROUTES.get(path)
+        if route is None:
+            self.send_json({"error": "Not found"}, 404)
+            return
+        if data is None:
+            self.send_json({"success": False, "error": "bad json"}, 400)
+            return
+        route(self, data)
+    
+    def _get_index(self):
+        if _index_bytes is None:
+            load_index()
+            if _index_bytes is None:
+                self.send_error(404)
+                return
+        if index_not_modified(self.headers.get('If-Modified-Since')):
+            self.send_response(304)
+            self.send_header('Last-Modified', _index_last_modified)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
             self.end_headers()
-            with open('index.html', 'rb') as f:
-                self.wfile.write(f.read())
             return
+        self.send_response(200)
+        body = self.pick_encoding(_index_bytes, _index_gzip)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Last-Modified', _index_last_modified)
+        self.send_header('Cache-Control', 'no-cache')  # always revalidate, so deploys show up
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _get_ping(self):
+        # Simple ping endpoint for keeping Render alive
+        self.send_json({
+            "status": "alive",
+            "timestamp": time.time(),
+            "uptime": time.time()
+        })
+    
+    def _get_trivia(self):
+        # Plain values only, so a split is enough (no parse_qs unquoting)
+        difficulty, count = 'easy', 1
+        for kv in self.query_string.split('&'):
+            key, _, value = kv.partition('=')
+            if key == 'difficulty':
+                difficulty = value
+            elif key == 'count':
+                try:
+                    count = max(1, min(int(value), 10))
+                except ValueError:
+                    pass
         
-        if path == '/ping':
-            # Simple ping endpoint for keeping Render alive
-            self.send_json({
-                "status": "alive",
-                "timestamp": time.time(),
-                "uptime": time.time()
-            })
-            return
+        questions = get_trivia_question(difficulty, count)
+        self.send_json({"success": True, "questions": questions})
+    
+    def _get_graph(self):
+        data = generate_graph_data()
+        self.send_json({"success": True, "graph": data})
+    
+    def _get_bitcoin(self):
+        i = rng().randrange(_N_BITCOIN)
+        self.send_raw_json(_BITCOIN_BYTES[i], gzipped=_BITCOIN_GZIP[i])
+    
+    def _get_personal(self):
+        i = rng().randrange(_N_PERSONAL)
+        self.send_raw_json(_PERSONAL_BYTES[i], gzipped=_PERSONAL_GZIP[i])
+    
+    def _get_leaderboard(self):
+        # Built from the in-memory DB, so there is no file fallback
+        body, gzipped = get_leaderboard_bytes()
+        self.send_raw_json(body, gzipped=gzipped)
+    
+    def _get_health(self):
+        db = load_db()
+        self.send_json({
+            "status": "ok",
+            "trivia_cache": trivia_counts,
+            "total_users": len(db.get("users", {})),
+            "total_sessions": len(db.get("sessions", {})),
+            "uptime": time.time()
+        })
+    
+    def _post_signup(self, data):
+        username = str_field(data, 'username').strip()
+        password = str_field(data, 'password').strip()
+        emoji = data.get('emoji', '😀')
         
-        if path == '/api/trivia':
-            params = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
-            difficulty = params.get('difficulty', ['easy'])[0]
-            count = min(int(params.get('count', ['1'])[0]), 10)
-            
-            questions = get_trivia_question(difficulty, count)
-            self.send_json({"success": True, "questions": questions})
+        if not username or not password:
+            self.send_json({"success": False, "error": "Username and password required"}, 400)
             return
-        
-        if path == '/api/graph':
-            data = generate_graph_data()
-            self.send_json({"success": True, "graph": data})
+        if not isinstance(emoji, str):
+            self.send_json({"success": False, "error": "Invalid emoji"}, 400)
             return
-        
-        if path == '/api/bitcoin':
-            data = generate_bitcoin_opportunity()
-            self.send_json({"success": True, "opportunity": data})
+        if len(username) < 2 or len(username) > 20:
+            self.send_json({"success": False, "error": "Username must be 2-20 characters"}, 400)
+            return
+        if len(password) < 3:
+            self.send_json({"success": False, "error": "Password must be 3+ characters"}, 400)
             return
         
-        if path == '/api/personal':
-            q = random.choice(PERSONAL_QUESTIONS)
-            self.send_json({"success": True, "question": q})
+        db = load_db()
+        user = create_user(db, username, password, emoji)
+        if not user:
+            self.send_json({"success": False, "error": "Username already taken"}, 409)
             return
         
-        if path == '/api/leaderboard':
-            with lb_lock:
-                lb = list(cached_leaderboard[:20])
-            if not lb:
-                # Fallback to DB if cache empty
-                db = load_db()
-                lb = db.get("leaderboard", [])[:20]
-            self.send_json({"success": True, "leaderboard": lb})
+        token = create_session(db, user["username"])
+        self.send_json({
+            "success": True,
+            "token": token,
+            "user": {
+                "username": user["username"],
+                "emoji": emoji,
+                "high_score": 0,
+            }
+        })
+    
+    def _post_login(self, data):
+        username = str_field(data, 'username').strip()
+        password = str_field(data, 'password').strip()
+        
+        if not username or not password:
+            self.send_json({"success": False, "error": "Username and password required"}, 400)
             return
         
-        if path == '/api/health':
-            with trivia_lock:
-                cache_status = {k: len(v) for k, v in trivia_cache.items()}
-            db = load_db()
-            self.send_json({
-                "status": "ok",
-                "trivia_cache": cache_status,
-                "total_users": len(db.get("users", {})),
-                "total_sessions": len(db.get("sessions", {})),
-                "uptime": time.time()
-            })
+        db = load_db()
+        user = auth_user(db, username, password)
+        if not user:
+            self.send_json({"success": False, "error": "Invalid credentials"}, 401)
             return
         
-        # Serve static files
-        super().do_GET()
+        token = create_session(db, user["username"])
+        self.send_json({
+            "success": True,
+            "token": token,
+            "user": {
+                "username": user["username"],
+                "emoji": user.get("emoji", "😀"),
+                "high_score": user.get("high_score", 0),
+                "total_games": user.get("total_games", 0),
+                "total_wins": user.get("total_wins", 0),
+            }
+        })
     
-    def do_POST(self):
-        path = self.path.split('?')[0]
-        data = self.read_json()
+    def _post_score(self, data):
+        db, username = self.session_user(data)
         
-        if path == '/api/signup':
-            username = data.get('username', '').strip()
-            password = data.get('password', '').strip()
-            emoji = data.get('emoji', '😀')
-            
-            if not username or not password:
-                self.send_json({"success": False, "error": "Username and password required"}, 400)
-                return
-            if len(username) < 2 or len(username) > 20:
-                self.send_json({"success": False, "error": "Username must be 2-20 characters"}, 400)
-                return
-            if len(password) < 3:
-                self.send_json({"success": False, "error": "Password must be 3+ characters"}, 400)
-                return
-            
-            db = load_db()
-            user = create_user(db, username, password, emoji)
-            if not user:
-                self.send_json({"success": False, "error": "Username already taken"}, 409)
-                return
-            
-            token = create_session(db, username)
-            self.send_json({
-                "success": True,
-                "token": token,
-                "user": {
-                    "username": username,
-                    "emoji": emoji,
-                    "high_score": 0,
-                }
-            })
+        if not username:
+            self.send_json({"success": False, "error": "Not logged in"}, 401)
             return
         
-        if path == '/api/login':
-            username = data.get('username', '').strip()
-            password = data.get('password', '').strip()
-            
-            if not username or not password:
-                self.send_json({"success": False, "error": "Username and password required"}, 400)
-                return
-            
-            db = load_db()
-            user = auth_user(db, username, password)
-            if not user:
-                self.send_json({"success": False, "error": "Invalid credentials"}, 401)
-                return
-            
-            token = create_session(db, username)
-            self.send_json({
-                "success": True,
-                "token": token,
-                "user": {
-                    "username": username,
-                    "emoji": user.get("emoji", "😀"),
-                    "high_score": user.get("high_score", 0),
-                    "total_games": user.get("total_games", 0),
-                    "total_wins": user.get("total_wins", 0),
-                }
-            })
+        score = data.get('score', 0)
+        crashes = data.get('crashes', 0)
+        streak = data.get('streak', 0)
+        extra_stats = {
+            "clicks": data.get('clicks', 0),
+            "cashouts": data.get('cashouts', 0),
+            "level": data.get('level', 0),
+            "play_time": data.get('play_time', 0),
+        }
+        # Reject bad values here; once queued the client has been told it worked
+        if not all(map(valid_stat, (score, crashes, streak, *extra_stats.values()))):
+            self.send_json({"success": False, "error": "Invalid score data"}, 400)
             return
         
-        if path in ('/api/score', '/api/update_score'):
-            token = data.get('token', data.get('session', ''))
-            db = load_db()
-            username = get_session_user(db, token)
-            
-            if not username:
-                self.send_json({"success": False, "error": "Not logged in"}, 401)
-                return
-            
-            score = data.get('score', 0)
-            crashes = data.get('crashes', 0)
-            streak = data.get('streak', 0)
-            extra_stats = {
-                "clicks": data.get('clicks', 0),
-                "cashouts": data.get('cashouts', 0),
-                "level": data.get('level', 0),
-                "play_time": data.get('play_time', 0),
-            }
-            
-            update_score(db, username, score, crashes, streak, extra_stats)
-            self.send_json({"success": True, "recorded": score})
-            return
+        # Applied in the next batch by score_writer_thread
+        score_queue.put((username, score, crashes, streak, extra_stats))
+        self.send_json({"success": True, "recorded": score})
+    
+    def _post_user_stats(self, data):
+        db, username = self.session_user(data)
         
-        if path == '/api/user_stats':
-            token = data.get('token', data.get('session', ''))
-            db = load_db()
-            username = get_session_user(db, token)
-            
-            if not username:
-                self.send_json({"success": False, "error": "Not logged in"}, 401)
-                return
-            
-            stats = get_user_stats(db, username)
-            if stats:
-                self.send_json({"success": True, "stats": stats})
-            else:
-                self.send_json({"success": False, "error": "User not found"}, 404)
+        if not username:
+            self.send_json({"success": False, "error": "Not logged in"}, 401)
             return
         
-        if path == '/api/check_session':
-            token = data.get('token', data.get('session', ''))
-            db = load_db()
-            username = get_session_user(db, token)
-            
-            if not username:
-                self.send_json({"success": False})
-                return
-            
-            user = get_user(db, username)
-            self.send_json({
-                "success": True,
-                "user": {
-                    "username": username,
-                    "emoji": user.get("emoji", "😀") if user else "😀",
-                    "high_score": user.get("high_score", 0) if user else 0,
-                    "total_games": user.get("total_games", 0) if user else 0,
-                    "total_wins": user.get("total_wins", 0) if user else 0,
-                    "best_streak": user.get("best_streak", 0) if user else 0,
-                }
-            })
+        stats = get_user_stats(db, username)
+        if stats:
+            self.send_json({"success": True, "stats": stats})
+        else:
+            self.send_json({"success": False, "error": "User not found"}, 404)
+    
+    def _post_check_session(self, data):
+        db, username = self.session_user(data)
+        
+        if not username:
+            self.send_json({"success": False})
             return
         
-        self.send_json({"error": "Not found"}, 404)
+        user = get_user(db, username)
+        self.send_json({
+            "success": True,
+            "user": {
+                "username": username,
+                "emoji": user.get("emoji", "😀") if user else "😀",
+                "high_score": user.get("high_score", 0) if user else 0,
+                "total_games": user.get("total_games", 0) if user else 0,
+                "total_wins": user.get("total_wins", 0) if user else 0,
+                "best_streak": user.get("best_streak", 0) if user else 0,
+            }
+        })
+    
+    # Path -> handler method, looked up once per request instead of an if-chain
+    _GET_ROUTES = {
+        '/': _get_index,
+        '/ping': _get_ping,
+        '/api/trivia': _get_trivia,
+        '/api/graph': _get_graph,
+        '/api/bitcoin': _get_bitcoin,
+        '/api/personal': _get_personal,
+        '/api/leaderboard': _get_leaderboard,
+        '/api/health': _get_health,
+    }
+    _POST_ROUTES = {
+        '/api/signup': _post_signup,
+        '/api/login': _post_login,
+        '/api/score': _post_score,
+        '/api/update_score': _post_score,
+        '/api/user_stats': _post_user_stats,
+        '/api/check_session': _post_check_session,
+    }
     
     def log_message(self, format, *args):
         # Suppress normal request logs, only show errors
@@ -988,6 +1713,30 @@ class GreedHandler(SimpleHTTPRequestHandler):
             print(f"[404] {args[0]}")
 
 
+class GreedHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that caps how many connection threads exist at once"""
+    
+    def __init__(self, server_address, handler_class):
+        super().__init__(server_address, handler_class)
+        self.connection_slots = threading.BoundedSemaphore(MAX_CONNECTIONS)
+    
+    def process_request(self, request, client_address):
+        if not self.connection_slots.acquire(blocking=False):
+            self.shutdown_request(request)  # at the limit; refuse rather than spawn
+            return
+        try:
+            super().process_request(request, client_address)
+        except Exception:
+            self.connection_slots.release()  # thread never started
+            raise
+    
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self.connection_slots.release()
+
+
 # ============================================================
 # MAIN
 # ============================================================
@@ -995,27 +1744,35 @@ if __name__ == "__main__":
     # Load caches
     load_trivia_cache()
     load_db()  # Initialize database
+    load_index()
+    tune_scrypt()
     
     # Pre-fetch trivia in background
     fetch_thread = threading.Thread(target=prefetch_trivia, daemon=True)
     fetch_thread.start()
     
     # Background refetch thread
-    refetch = threading.Thread(target=refetch_thread, daemon=True)
+    refetch = threading.Thread(target=run_supervised, args=(refetch_thread,), daemon=True)
     refetch.start()
     
-    # Leaderboard auto-refresh thread (every 1 minute)
-    lb_thread = threading.Thread(target=leaderboard_refresh_thread, daemon=True)
-    lb_thread.start()
-    
     # Database auto-save thread
-    autosave_thread = threading.Thread(target=db_autosave_thread, daemon=True)
+    autosave_thread = threading.Thread(target=run_supervised, args=(db_autosave_thread,), daemon=True)
     autosave_thread.start()
     
+    # Batched score writer
+    score_thread = threading.Thread(target=run_supervised, args=(score_writer_thread,), daemon=True)
+    score_thread.start()
+    
+    # Expired session sweep
+    sweep_thread = threading.Thread(target=run_supervised, args=(session_sweep_thread,), daemon=True)
+    sweep_thread.start()
+    
     # Initial leaderboard load
     refresh_leaderboard()
     
-    server = HTTPServer(("0.0.0.0", PORT), GreedHandler)
+    # One thread per connection, at most MAX_CONNECTIONS of them;
+    # request_slots bounds the work in flight
+    server = GreedHTTPServer(("0.0.0.0", PORT), GreedHandler)
     
     print()
     print("=" * 50)
@@ -1025,14 +1782,23 @@ if __name__ == "__main__":
     print()
     print(f"  Trivia cache: easy={len(trivia_cache.get('easy', []))}, medium={len(trivia_cache.get('medium', []))}, hard={len(trivia_cache.get('hard', []))}")
     print(f"  Database: {DB_FILE}")
-    print(f"  Leaderboard refresh: every {LEADERBOARD_REFRESH_INTERVAL}s")
-    print(f"  Auto-save: every {DB_SAVE_INTERVAL}s")
+    print(f"  Leaderboard refresh: on change, TTL {LEADERBOARD_REFRESH_INTERVAL}s")
+    print(f"  Auto-save: {DB_SAVE_INTERVAL}s after changes")
+    print(f"  Concurrent requests: {MAX_CONCURRENT_REQUESTS}, connections: {MAX_CONNECTIONS}")
     print()
     
+    # Hosts stop the process with SIGTERM; take the same path as Ctrl+C so
+    # the in-memory DB gets its final flush
+    def _handle_sigterm(signum, frame):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)  # don't interrupt the final save
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, _handle_sigterm)
+    
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\n[INFO] Shutting down...")
-        save_trivia_cache()
+        save_trivia_cache(force=True)
+        score_queue.join()  # let queued scores land before the final save
         save_db(force=True)  # Final save
-        server.shutdown()
+        server.server_close()